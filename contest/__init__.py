@@ -1,12 +1,31 @@
+"""Tools for the Weights & Biases DAVIS Video Segmentation Contest.
+
+The framework-specific subpackages, contest.keras and contest.torch,
+are only imported when first accessed, so that importing contest
+does not pull in TensorFlow or PyTorch unless they are used.
+"""
+import importlib
+
 from . import evaluate
 from . import utils
 
-try:
-  from . import keras_utils as keras
-except ImportError:
-  pass
+_lazy_submodules = {"keras": ".keras_utils",
+                    "torch": ".torch_utils"}
+
+
+def __getattr__(name):
+  if name not in _lazy_submodules:
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+  try:
+    module = importlib.import_module(_lazy_submodules[name], __name__)
+  except ImportError as e:
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}"
+                         f" (failed to import {_lazy_submodules[name][1:]}: {e})") from e
+
+  globals()[name] = module
+  return module
+
 
-try:
-  from . import torch_utils as torch
-except ImportError:
-  pass
+def __dir__():
+  return sorted(set(globals()) | set(_lazy_submodules))
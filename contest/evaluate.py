@@ -1,14 +1,13 @@
 """Tools for packaging and evaluating results,
 including making a result artifact and computing the IoU score.
+
+pandas, wandb, and the image utilities are imported inside the functions
+that need them, so that scoring with iou_from_output stays cheap to import.
 """
 import os
 import warnings
 
 import numpy as np
-import pandas as pd
-import wandb
-
-from .utils import image
 
 
 def iou_from_output(prediction, annotation):
@@ -87,6 +86,10 @@ def run_evaluation(output_paths, annotation_paths, max_index=None):
     metrics: dict[string: numeric or wandb.Media]
       Metrics from evaluation to log to Weights & Biases
   """
+  import pandas as pd
+  import wandb
+
+  from .utils import image
 
   max_index = max_index or len(annotation_paths) - 1
 
@@ -129,6 +132,8 @@ def name_submission(result_name, suffix=""):
 
 
 def build_table(evaluation):
+  import wandb
+
   evaluation_table = wandb.Table(columns=["out", "target", "iou_score"])
   for row in evaluation:
     evaluation_table.add_data(*row)
@@ -144,6 +149,8 @@ def make_result_artifact(output_paths, name, output_dir="outputs",
   For a submission to be valid, metadata must include the parameter count
   at the key "nparams".
   """
+  import wandb
+
   if metadata is None:
     metadata = {}
 
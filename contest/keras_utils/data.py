@@ -3,6 +3,7 @@ using the Keras library.
 """
 import math
 
+import tensorflow as tf
 import tensorflow.keras as keras
 import numpy as np
 import skimage.io
@@ -40,3 +41,36 @@ class VidSegDatasetSequence(keras.utils.Sequence):
 
   def _batch_start(self, idx):
     return idx * self.batch_size
+
+
+def image_pipeline(image_paths, batch_size=32, image_shape=None):
+  """From a pd.Series of paths to image files, creates a tf.data.Dataset
+  that decodes the images in parallel and yields prefetched np.uint8 batches,
+  in the same order as VidSegDatasetSequence.
+
+  All images must share image_shape, given as HWC, or HW for grayscale,
+  or otherwise read from the first image, so that batches have
+  a fixed shape apart from the batch dimension.
+  """
+  if image_shape is None:
+    image_shape = skimage.io.imread(image_paths.iloc[0]).shape
+  image_shape = tuple(image_shape)
+
+  if len(image_shape) == 2:
+    channels = 1
+  elif len(image_shape) == 3:
+    channels = image_shape[-1]
+  else:
+    raise ValueError(f"image_shape must be HW or HWC, not {image_shape}")
+
+  def load(path):
+    image = tf.io.decode_image(tf.io.read_file(path), channels=channels,
+                               expand_animations=False)
+    if len(image_shape) == 2:
+      image = tf.squeeze(image, axis=-1)
+    return tf.ensure_shape(image, image_shape)
+
+  pipeline = tf.data.Dataset.from_tensor_slices(list(image_paths))
+  pipeline = pipeline.map(load, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+  pipeline = pipeline.batch(batch_size)
+  return pipeline.prefetch(tf.data.experimental.AUTOTUNE)
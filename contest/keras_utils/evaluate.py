@@ -2,31 +2,91 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import tensorflow as tf
 
-from . import utils
-from ..utils import image
+from . import data, utils
+from ..utils import clips, image, keyframes
 
-def run(model, evaluation_dataset, num_images, output_dir):
+def run(model, evaluation_dataset, num_images, output_dir, clip_ids=None, keyframe_interval=1,
+        compiled=False, jit_compile=False):
   """Runs keras model on the data in evaluation dataset
   and saves the output in output_dir so it can be packaged into
   a result Artifact. See ..evaluate.make_result_artifact function.
+
+  If keyframe_interval is greater than 1, model is only run on every
+  keyframe_interval-th frame of each clip, and on its last frame,
+  and the outputs for the frames in between are interpolated.
+  See ..utils.keyframes. evaluation_dataset must then be a
+  data.VidSegDatasetSequence. Clips are identified by clip_ids, a pd.Series
+  aligned with the dataset, or else inferred from its image_paths.
+
+  If compiled is True, evaluation_dataset must be a data.VidSegDatasetSequence,
+  and model is run as a tf.function, optionally compiled with XLA if jit_compile,
+  on batches from data.image_pipeline over the same paths. See compiled_forward.
   """
   output_dir = Path(output_dir)
   output_paths = pd.DataFrame([np.nan] * num_images, columns=["output"])
 
-  ii = 0
+  if keyframe_interval > 1:
+    if clip_ids is None:
+      image_paths = evaluation_dataset.image_paths.reset_index(drop=True)
+      clip_ids = clips.get_clips(image_paths.to_frame("raw"), columns=["raw"])
+    evaluation_dataset = keyframe_sequence(evaluation_dataset, clip_ids, keyframe_interval)
 
-  for jj in range(len(evaluation_dataset)):
+  if compiled:
+    outputs = compiled_forward(model, evaluation_dataset, jit_compile)
+  else:
+    outputs = forward(model, evaluation_dataset)
+  if keyframe_interval > 1:
+    outputs = keyframes.propagate(outputs, clip_ids, keyframe_interval)
 
-    outputs = model(evaluation_dataset[jj])
-    outputs = utils.to_numpy_int_arrays(outputs)
+  for ii, output in enumerate(outputs):
+    path = Path(image.save_from_array(output, output_dir, ii))
 
-    for output in outputs:
-      path = Path(image.save_from_array(output, output_dir, ii))
+    path_in_artifact = path.relative_to(Path(output_dir).parent)
 
-      path_in_artifact = path.relative_to(Path(output_dir).parent)
-        
-      output_paths["output"].iloc[ii] = str(path_in_artifact)
-      ii += 1
+    output_paths["output"].iloc[ii] = str(path_in_artifact)
 
   return output_paths
+
+
+def forward(model, evaluation_dataset):
+  """Runs model on each batch from evaluation_dataset and yields
+  the outputs one frame at a time, as np.uint8 arrays.
+  """
+  for jj in range(len(evaluation_dataset)):
+    outputs = model(evaluation_dataset[jj])
+    yield from utils.to_numpy_int_arrays(outputs)
+
+
+def compiled_forward(model, evaluation_dataset, jit_compile=False):
+  """Runs model, as a tf.function with a fixed input signature,
+  on prefetched batches of the images in the data.VidSegDatasetSequence
+  evaluation_dataset and yields the outputs one frame at a time, as np.uint8 arrays.
+  """
+  pipeline = data.image_pipeline(evaluation_dataset.image_paths, evaluation_dataset.batch_size)
+  predict = compile_model(model, pipeline.element_spec, jit_compile)
+  for images in pipeline:
+    yield from utils.to_numpy_int_arrays(predict(images))
+
+
+def compile_model(model, input_spec, jit_compile=False):
+  """Wraps inference with model in a tf.function traced once for input_spec,
+  a tf.TensorSpec whose batch dimension should be None.
+  """
+  def predict(images):
+    return model(images, training=False)
+
+  try:
+    return tf.function(predict, input_signature=[input_spec], jit_compile=jit_compile)
+  except TypeError:
+    return tf.function(predict, input_signature=[input_spec], experimental_compile=jit_compile)
+
+
+def keyframe_sequence(evaluation_dataset, clip_ids, keyframe_interval):
+  """Returns a data.VidSegDatasetSequence like evaluation_dataset
+  over only its keyframes. See ..utils.keyframes.keyframe_indices.
+  """
+  indices = keyframes.keyframe_indices(clip_ids, keyframe_interval)
+  image_paths = evaluation_dataset.image_paths.iloc[indices].reset_index(drop=True)
+  return data.VidSegDatasetSequence(image_paths, batch_size=evaluation_dataset.batch_size)
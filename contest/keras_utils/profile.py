@@ -1,9 +1,15 @@
+import itertools
+import time
+
+import numpy as np
 import tensorflow as tf
 import tensorflow.keras as keras
 from tensorflow.python.framework.convert_to_constants import (
     convert_variables_to_constants_v2_as_graph,
 )
 
+from . import data, evaluate
+
 
 def count_params(model):
   return model.count_params()
@@ -41,3 +47,88 @@ def count_flops(model, dummy_inputs, batch_size=None):
     graph=frozen_func.graph, run_meta=run_meta, cmd="scope", options=opts
   )
   return flops.total_float_ops
+
+
+def measure_fps(model, evaluation_dataset, compiled=True, jit_compile=False):
+  """Runs model over evaluation_dataset, as in evaluate.run but without saving outputs,
+  and reports the throughput in frames per second, including decoding
+  and conversion of outputs to np.uint8 arrays.
+
+  The first batch, which pays for building the input pipeline and for tracing
+  and compiling the tf.function, is timed separately and excluded
+  from the throughput, so evaluation_dataset needs at least two batches.
+
+  Returns:
+    report: dict
+      frames_per_second after the first batch, the number of frames
+      that rate is measured over, and warmup_seconds for the first batch.
+
+  The compiled and eager paths decode images differently,
+  so check that they agree with compare_compiled before comparing their rates.
+  """
+  if compiled:
+    outputs = evaluate.compiled_forward(model, evaluation_dataset, jit_compile)
+  else:
+    outputs = evaluate.forward(model, evaluation_dataset)
+
+  start = time.perf_counter()
+  for _ in itertools.islice(outputs, evaluation_dataset.batch_size):
+    pass
+  warmup_seconds = time.perf_counter() - start
+
+  start = time.perf_counter()
+  frames = sum(1 for _ in outputs)
+  seconds = time.perf_counter() - start
+  if frames == 0:
+    raise ValueError("measure_fps needs an evaluation_dataset with at least two batches")
+
+  return {"frames_per_second": frames / seconds,
+          "frames": frames,
+          "warmup_seconds": warmup_seconds}
+
+
+def compare_compiled(model, evaluation_dataset, jit_compile=False, input_atol=0, output_atol=1):
+  """Checks that the compiled path of evaluate.run matches the eager path
+  on the first batch of the data.VidSegDatasetSequence evaluation_dataset:
+  that data.image_pipeline decodes the same np.uint8 images as the Sequence,
+  and that evaluate.compiled_forward yields the same masks as evaluate.forward.
+
+  Raises a ValueError if the images differ by more than input_atol,
+  or the masks by more than output_atol, in np.uint8 levels.
+  The default output_atol allows for masks that round differently
+  after XLA or graph optimizations reorder floating point operations.
+
+  Returns:
+    report: dict
+      The largest input_difference and output_difference on the first batch.
+  """
+  eager_images = evaluation_dataset[0]
+  if isinstance(eager_images, (list, tuple)):
+    eager_images = eager_images[0]
+  eager_images = np.asarray(eager_images)
+
+  pipeline = data.image_pipeline(evaluation_dataset.image_paths, evaluation_dataset.batch_size)
+  compiled_images = next(iter(pipeline)).numpy()
+  if eager_images.shape != compiled_images.shape:
+    raise ValueError(f"image_pipeline produced inputs of shape {compiled_images.shape}, "
+                     f"but the Sequence produced {eager_images.shape}")
+  input_difference = _max_difference(eager_images, compiled_images)
+  if input_difference > input_atol:
+    raise ValueError(f"image_pipeline inputs differ from the Sequence's by up to "
+                     f"{input_difference}, more than input_atol {input_atol}")
+
+  num_frames = len(eager_images)
+  eager_outputs = list(itertools.islice(evaluate.forward(model, evaluation_dataset), num_frames))
+  compiled_outputs = list(itertools.islice(
+    evaluate.compiled_forward(model, evaluation_dataset, jit_compile), num_frames))
+  output_difference = max(_max_difference(eager, compiled)
+                          for eager, compiled in zip(eager_outputs, compiled_outputs))
+  if output_difference > output_atol:
+    raise ValueError(f"compiled outputs differ from eager outputs by up to "
+                     f"{output_difference}, more than output_atol {output_atol}")
+
+  return {"input_difference": input_difference, "output_difference": output_difference}
+
+
+def _max_difference(first, second):
+  return int(np.abs(first.astype(np.int32) - second.astype(np.int32)).max())
@@ -4,6 +4,8 @@ import numpy as np
 import tensorflow.keras as keras
 import wandb
 
+from ..utils import cache
+
 
 def save_model_to_artifact(model_path, name, artifact_path="final_model"):
   """During a wandb.Run, save the model at model_path as a wandb.Artifact
@@ -21,12 +23,26 @@ def save_model_to_artifact(model_path, name, artifact_path="final_model"):
   return "/".join([wandb.run.entity, wandb.run.project, model_artifact.name])
 
 
-def load_model_from_artifact(name, model_path="final_model"):
-  model_artifact = wandb.run.use_artifact(name)
-  model_artifact_dir = model_artifact.download()
+def load_model_from_artifact(name, model_path="final_model", use_cache=True, share_model=False):
+  """Pulls down the wandb.Artifact at name and loads the Keras model at model_path.
+
+  If use_cache, the Artifact's files come from the process-wide ..utils.cache,
+  which only downloads each Artifact digest once. If share_model is also True,
+  the loaded model itself is kept in memory and returned to later calls
+  for the same Artifact and model_path, so it must not be modified in place.
+  """
+  def loader(model_artifact_dir):
+    return keras.models.load_model(os.path.join(model_artifact_dir, model_path))
+
+  if not use_cache:
+    model_artifact = wandb.run.use_artifact(name)
+    return loader(model_artifact.download())
+
+  if share_model:
+    return cache.get_cache().load(name, loader, key=model_path)
 
-  model = keras.models.load_model(os.path.join(model_artifact_dir, model_path))
-  return model
+  _, model_artifact_dir = cache.get_cache().download(name)
+  return loader(model_artifact_dir)
 
 
 def to_numpy_int_arrays(outputs, scale=255):
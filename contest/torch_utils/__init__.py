@@ -1 +1 @@
-from . import data, evaluate, profile, utils
+from . import data, evaluate, profile, quantize, tiling, utils
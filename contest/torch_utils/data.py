@@ -1,57 +1,170 @@
 """Tools for working with data for the DAVIS contest
 using the PyTorch and PyTorch Lightning libraries.
 """
+import pandas as pd
 import pytorch_lightning as pl
 import skimage.io
 import torch
 from torchvision import transforms
 
-from ..utils import clips
+from ..utils import clips, paths
 
 
+default_mean = [0.485, 0.456, 0.406]
+default_std = [0.229, 0.224, 0.225]
+
 default_image_transform = transforms.Compose([
       transforms.ToTensor(),
-      transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                           std=[0.229, 0.224, 0.225])
+      transforms.Normalize(mean=default_mean,
+                           std=default_std)
     ])
 default_mask_transform = transforms.Compose([
       transforms.ToTensor(),
     ])
 
 
+def uint8_image_transform(img):
+  """Converts an HWC np.uint8 image into a CHW torch.uint8 Tensor,
+  without rescaling or normalizing it. See normalize_batch.
+  """
+  return torch.from_numpy(img).permute(2, 0, 1).contiguous()
+
+
+def uint8_mask_transform(mask):
+  """Converts an HW np.uint8 mask into a 1HW torch.uint8 Tensor,
+  without rescaling it. See normalize_batch.
+  """
+  return torch.from_numpy(mask).unsqueeze(0).contiguous()
+
+
+def normalize_batch(batch, mean=None, std=None):
+  """Converts a batch of torch.uint8 images, and optionally masks,
+  from a VidSegDataset with uint8_transport=True into the float Tensors
+  that default_image_transform and default_mask_transform would have produced.
+
+  Apply this after the batch has left the DataLoader workers,
+  ideally after it has been moved to the device,
+  so that only uint8 data crosses process boundaries.
+
+  Parameters:
+    batch: torch.Tensor or tuple of torch.Tensor
+      Either a BCHW batch of images or a tuple (images, masks),
+      where masks are B1HW or BHW.
+    mean, std: None or list of float
+      Per-channel statistics for normalization.
+      Defaults to default_mean and default_std.
+
+  Returns:
+    batch: torch.Tensor or tuple of torch.Tensor
+      Images as normalized float32 Tensors and masks
+      as float32 Tensors with values from 0 to 1 and a channel axis.
+  """
+  if isinstance(batch, (list, tuple)):
+    images, masks = batch
+    return normalize_images(images, mean, std), normalize_masks(masks)
+  return normalize_images(batch, mean, std)
+
+
+def normalize_images(images, mean=None, std=None):
+  if mean is None:
+    mean = default_mean
+  if std is None:
+    std = default_std
+
+  # same operations, in the same order, as ToTensor followed by Normalize
+  images = images.to(dtype=torch.get_default_dtype()).div(255)
+  mean = torch.as_tensor(mean, dtype=images.dtype, device=images.device)
+  std = torch.as_tensor(std, dtype=images.dtype, device=images.device)
+  return images.sub_(mean[:, None, None]).div_(std[:, None, None])
+
+
+def normalize_masks(masks):
+  if masks.dtype != torch.uint8:
+    return masks
+  if masks.ndim == 3:
+    masks = masks.unsqueeze(1)
+  return masks.to(dtype=torch.get_default_dtype()).div(255)
+
+
 class VidSegDataset(torch.utils.data.Dataset):
   """From a pd.DataFrame of paths to image files and (optionally)
   to segmentation annotation images for those images,
   creates a simple subclass of torch.utils.data.Dataset suitable for use in
   a Video Segmentation task.
+
+  If uint8_transport is True, images default to uint8_image_transform,
+  so that samples stay np.uint8-sized on their way out of DataLoader workers.
+  Batches must then be passed through normalize_batch before use.
+
+  Paths are stored as ..utils.paths.PackedStrings, so that forked DataLoader
+  workers share them instead of each copying them as they are read.
+  image_paths, annotation_paths, and paths_df are rebuilt as pandas objects
+  on first access and then cached, as they are only needed in the parent process.
+  paths_df only contains the "raw" and, with annotations, "annotation" columns
+  of the pd.DataFrame the dataset was created from.
+  Assigning to paths_df replaces the stored paths.
   """
-  def __init__(self, paths_df, has_annotations=True, image_transform=None, mask_transform=None):
-    self.paths_df = paths_df
+  def __init__(self, paths_df, has_annotations=True, image_transform=None, mask_transform=None,
+               uint8_transport=False):
     self.has_annotations = has_annotations
-
-    self.image_paths = self.paths_df["raw"]
-    if self.has_annotations:
-      self.annotation_paths = self.paths_df["annotation"]
+    self.uint8_transport = uint8_transport
+    self.paths_df = paths_df
 
     if image_transform is None:
-      self.image_transform = default_image_transform
+      if self.uint8_transport:
+        self.image_transform = uint8_image_transform
+      else:
+        self.image_transform = default_image_transform
     else:
       self.image_transform = image_transform
 
     self.mask_transform = mask_transform 
 
+  @property
+  def image_paths(self):
+    if self._image_paths_series is None:
+      self._image_paths_series = self._image_paths.to_series(self._index, name="raw")
+    return self._image_paths_series
+
+  @property
+  def annotation_paths(self):
+    if not self.has_annotations:
+      raise AttributeError("VidSegDataset without annotations has no annotation_paths")
+    if self._annotation_paths_series is None:
+      self._annotation_paths_series = self._annotation_paths.to_series(
+        self._index, name="annotation")
+    return self._annotation_paths_series
+
+  @property
+  def paths_df(self):
+    if self._paths_df is None:
+      columns = [self.image_paths]
+      if self.has_annotations:
+        columns.append(self.annotation_paths)
+      self._paths_df = pd.concat(columns, axis=1)
+    return self._paths_df
+
+  @paths_df.setter
+  def paths_df(self, paths_df):
+    self._index = paths_df.index
+    self._image_paths = paths.PackedStrings(paths_df["raw"])
+    if self.has_annotations:
+      self._annotation_paths = paths.PackedStrings(paths_df["annotation"])
+    self._image_paths_series, self._annotation_paths_series = None, None
+    self._paths_df = None
+
   def __len__(self):
-    return len(self.image_paths)
+    return len(self._image_paths)
 
   def __getitem__(self, idx):
     if torch.is_tensor(idx):
-      idx = idx.to_list()
+      idx = idx.item()
 
-    img_name = self.image_paths.iloc[idx]
+    img_name = self._image_paths[idx]
     img = skimage.io.imread(img_name)
 
     if self.has_annotations:
-      annotation_name = self.annotation_paths.iloc[idx]
+      annotation_name = self._annotation_paths[idx]
       annotation = skimage.io.imread(annotation_name)
 
     if self.image_transform is not None:
@@ -79,6 +192,12 @@ class VidSegDataModule(pl.LightningDataModule):
   See the PyTorch Lightning docs for details on pl.LightningDataModule:
     https://pytorch-lightning.readthedocs.io/en/stable/datamodules.html?highlight=lightningdatamodule
     
+  If uint8_transport is True, DataLoader workers return torch.uint8 images and masks,
+  which are converted and normalized once per batch, after transfer to the device,
+  with normalize_batch. The resulting inputs are identical to those produced
+  by default_image_transform and default_mask_transform, which are then the only
+  supported values of image_transform and mask_transform.
+
   WARNING: this pl.LightningDataModule sets state in the setup method,
   and so is not suitable for multi-GPU training.
   """
@@ -87,9 +206,17 @@ class VidSegDataModule(pl.LightningDataModule):
                holdout_paths_df=None, split=0.8,
                num_workers=1, batch_size=None,
                image_transform=default_image_transform,
-               mask_transform=default_mask_transform):
+               mask_transform=default_mask_transform,
+               uint8_transport=False):
     super().__init__()
 
+    if uint8_transport:
+      if (image_transform is not default_image_transform
+              or mask_transform is not default_mask_transform):
+        raise ValueError("uint8_transport only supports the default image and mask transforms")
+      image_transform, mask_transform = uint8_image_transform, uint8_mask_transform
+    self.uint8_transport = uint8_transport
+
     if batch_size is None:
       self.batch_size = len(training_paths_df)
     else:
@@ -129,6 +256,11 @@ class VidSegDataModule(pl.LightningDataModule):
   def prepare_data(self, stage=None):
     pass
 
+  def on_after_batch_transfer(self, batch, dataloader_idx):
+    if self.uint8_transport:
+      batch = normalize_batch(batch)
+    return batch
+
   def train_dataloader(self):
     return torch.utils.data.DataLoader(self.training_data, batch_size=self.batch_size,
                                        num_workers=self.num_workers)
@@ -4,32 +4,114 @@ import numpy as np
 import pandas as pd
 import torch
 
-from . import utils
-from ..utils import clips, image, paths
+from . import tiling, utils
+from ..utils import clips, image, keyframes, paths
 
 
-def run(model, dataloader, num_images, output_dir):
+def run(model, dataloader, num_images, output_dir, clip_ids=None, keyframe_interval=1,
+        memory_budget=None, tile_context=tiling.default_context,
+        tile_blend=tiling.default_blend, tile_alignment=tiling.default_alignment):
   """Runs torch.Module model on the data in DataLoader
   and saves the output in output_dir so it can be packaged into
   a result Artifact. See ..evaluate.make_result_artifact function.
+
+  If keyframe_interval is greater than 1, model is only run on every
+  keyframe_interval-th frame of each clip, and on its last frame,
+  and the outputs for the frames in between are interpolated.
+  See ..utils.keyframes. Clips are identified by clip_ids, a pd.Series
+  aligned with the dataset, or else inferred from the "raw" paths
+  of the dataset's paths_df with clips.get_clips.
+
+  If memory_budget, in bytes, is provided, the batch size is chosen
+  so that each forward pass fits in the budget, and frames that do not fit
+  on their own are run as overlapping tiles. See .tiling.
+  The budget covers parameters and estimated activations only, so leave headroom.
+  For tiled outputs to match full-frame outputs, tile_context must cover
+  the model's receptive field radius and tile_alignment must be a multiple
+  of its output stride, e.g. 16 for a U-Net with four poolings.
   """
   output_dir = Path(output_dir)
   output_paths = pd.DataFrame([np.nan] * num_images, columns=["output"])
-  
-  with torch.no_grad():
-    ii = 0
-    for eval_batch in iter(dataloader):
-    
-      outputs = model.forward(eval_batch)
-      outputs = utils.to_numpy_int_arrays(outputs)
-
-      for output in outputs:
-        path = Path(image.save_from_array(output, output_dir, ii))
-        
-        # ensure that path inside artifact is set correctly: drop everything before output_dir
-        path_in_artifact = path.relative_to(Path(output_dir).parent)
-        
-        output_paths["output"].iloc[ii] = str(path_in_artifact)
-        ii += 1
-        
+
+  if keyframe_interval > 1:
+    if clip_ids is None:
+      if not hasattr(dataloader.dataset, "paths_df"):
+        raise ValueError("clip_ids is required for keyframe inference "
+                         "when the dataloader's dataset has no paths_df")
+      paths_df = dataloader.dataset.paths_df.reset_index(drop=True)
+      clip_ids = clips.get_clips(paths_df, columns=["raw"])
+    dataloader = keyframe_dataloader(dataloader, clip_ids, keyframe_interval)
+
+  tile_size = None
+  if memory_budget is not None:
+    frame = dataloader.dataset[0]
+    if isinstance(frame, (list, tuple)):
+      frame = frame[0]
+    batch_size, tile_size = tiling.plan(model, frame.shape, memory_budget,
+                                        tile_context, tile_blend, tile_alignment)
+    dataloader = rebuild_dataloader(dataloader, batch_size=batch_size)
+
+  outputs = forward(model, dataloader, tile_size, tile_context, tile_blend, tile_alignment)
+  if keyframe_interval > 1:
+    outputs = keyframes.propagate(outputs, clip_ids, keyframe_interval)
+
+  for ii, output in enumerate(outputs):
+    path = Path(image.save_from_array(output, output_dir, ii))
+
+    # ensure that path inside artifact is set correctly: drop everything before output_dir
+    path_in_artifact = path.relative_to(Path(output_dir).parent)
+
+    output_paths["output"].iloc[ii] = str(path_in_artifact)
+
   return output_paths
+
+
+def forward(model, dataloader, tile_size=None, context=tiling.default_context,
+            blend=tiling.default_blend, alignment=tiling.default_alignment):
+  """Runs model on each batch from dataloader and yields
+  the outputs one frame at a time, as np.uint8 arrays.
+  If tile_size is provided, runs model on tiles, see tiling.tiled_forward.
+  """
+  for eval_batch in iter(dataloader):
+    with torch.no_grad():
+      if tile_size is None:
+        outputs = model.forward(eval_batch)
+      else:
+        outputs = tiling.tiled_forward(model, eval_batch, tile_size,
+                                       context, blend, alignment)
+    yield from utils.to_numpy_int_arrays(outputs)
+
+
+def keyframe_dataloader(dataloader, clip_ids, keyframe_interval):
+  """Returns a DataLoader like dataloader over only the keyframes
+  of its dataset. See ..utils.keyframes.keyframe_indices.
+  """
+  indices = keyframes.keyframe_indices(clip_ids, keyframe_interval)
+  return rebuild_dataloader(dataloader,
+                            dataset=torch.utils.data.Subset(dataloader.dataset, indices))
+
+
+def rebuild_dataloader(dataloader, dataset=None, batch_size=None):
+  """Returns a new DataLoader with the same worker, collation, and memory settings
+  as dataloader, optionally with a different dataset or batch_size.
+  Samplers are not copied: the new DataLoader always iterates in order.
+  Unless batch_size is provided, dataloader must have been built with one,
+  not with a batch_sampler or batch_size=None.
+  """
+  if dataset is None:
+    dataset = dataloader.dataset
+  if batch_size is None:
+    batch_size = dataloader.batch_size
+    if batch_size is None:
+      raise ValueError("cannot rebuild a DataLoader without a batch_size, "
+                       "e.g. one built with a batch_sampler; pass a DataLoader with a batch_size")
+
+  # not every attribute exists in every supported version of torch
+  kwargs = {attribute: getattr(dataloader, attribute) for attribute in _dataloader_attributes
+            if hasattr(dataloader, attribute)}
+  return torch.utils.data.DataLoader(dataset, batch_size=batch_size, **kwargs)
+
+
+_dataloader_attributes = ["num_workers", "collate_fn", "pin_memory", "drop_last", "timeout",
+                          "worker_init_fn", "multiprocessing_context", "generator",
+                          "prefetch_factor", "persistent_workers", "pin_memory_device"]
@@ -1,8 +1,20 @@
-"""Utilities for counting parameters and operations of a torch.Module.
+"""Utilities for counting parameters and operations of a torch.Module,
+and for measuring the throughput of the data pipeline that feeds it.
 """
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
 import ptflops
 import torch
 
+from . import data
+
 
 def count_params(model):
   return sum(p.numel() for p in model.parameters())
@@ -15,3 +27,188 @@ def count_flops(model, device):
     except ZeroDivisionError:
       raise ValueError("failed to count model FLOPs")
     return int(macs / 2)
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+  """High-water mark of resident set size, in MB, for this process,
+  or with who=resource.RUSAGE_CHILDREN for the largest of its finished children.
+  """
+  scale = 1 if sys.platform == "darwin" else 1024
+  return resource.getrusage(who).ru_maxrss * scale / 2 ** 20
+
+
+def measure_loader(dataloader, max_batches=None, transform=None):
+  """Iterates over dataloader, applying transform to each batch if provided,
+  and reports the throughput in frames per second and the peak RSS
+  of this process and of the DataLoader workers.
+
+  Peak RSS values are high-water marks for the whole interpreter,
+  so they only describe dataloader when measured in a fresh one.
+  See compare_transports.
+  """
+  frames, batches = 0, 0
+  start = time.perf_counter()
+  batch_iterator = iter(dataloader)
+  for batch in batch_iterator:
+    frames += len(batch[0] if isinstance(batch, (list, tuple)) else batch)
+    if transform is not None:
+      transform(batch)
+    batches += 1
+    if max_batches is not None and batches >= max_batches:
+      break
+  seconds = time.perf_counter() - start
+
+  # shut down the workers, so that they count towards RUSAGE_CHILDREN
+  del batch_iterator
+
+  return {"frames": frames,
+          "seconds": seconds,
+          "frames_per_second": frames / seconds,
+          "main_peak_rss_mb": peak_rss_mb(),
+          "worker_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN)}
+
+
+def transport_loader(paths_df, uint8_transport, batch_size=16, num_workers=2):
+  """DataLoader over a VidSegDataset on paths_df, with or without uint8_transport."""
+  dataset = data.VidSegDataset(paths_df, mask_transform=None if uint8_transport
+                               else data.default_mask_transform,
+                               uint8_transport=uint8_transport)
+  return torch.utils.data.DataLoader(dataset, batch_size=batch_size,
+                                     num_workers=num_workers)
+
+
+_transport_script = """
+import json, sys
+import pandas as pd
+from contest.torch_utils import data, profile
+paths_df = pd.read_json(sys.argv[1])
+loader = profile.transport_loader(paths_df, {uint8_transport}, {batch_size}, {num_workers})
+transform = data.normalize_batch if {uint8_transport} else None
+print(json.dumps(profile.measure_loader(loader, {max_batches}, transform)))
+"""
+
+
+def compare_transports(paths_df, batch_size=16, num_workers=2, max_batches=None):
+  """Benchmarks VidSegDataset on paths_df with and without uint8_transport,
+  after checking that both produce identical inputs on the first batch.
+
+  Each pipeline is measured with measure_loader in a fresh Python interpreter,
+  so that their peak RSS values can be compared.
+
+  Returns:
+    report: dict[string: dict]
+      measure_loader results for the "float32" and "uint8" pipelines.
+  """
+  float_batch = next(iter(transport_loader(paths_df, False, batch_size, num_workers)))
+  uint8_batch = data.normalize_batch(
+    next(iter(transport_loader(paths_df, True, batch_size, num_workers))))
+  for float_tensor, uint8_tensor in zip(float_batch, uint8_batch):
+    if not torch.equal(float_tensor, uint8_tensor):
+      raise ValueError("uint8_transport produced different inputs than the default transforms")
+
+  report = {}
+  with tempfile.TemporaryDirectory() as temporary_dir:
+    paths_json = os.path.join(temporary_dir, "paths.json")
+    paths_df.reset_index(drop=True).to_json(paths_json)
+    for name, uint8_transport in [("float32", False), ("uint8", True)]:
+      script = _transport_script.format(uint8_transport=uint8_transport, batch_size=batch_size,
+                                        num_workers=num_workers, max_batches=max_batches)
+      result = subprocess.run([sys.executable, "-c", script, paths_json], check=True,
+                              stdout=subprocess.PIPE, universal_newlines=True)
+      report[name] = json.loads(result.stdout.strip().splitlines()[-1])
+
+  return report
+
+
+def private_memory_mb():
+  """Memory private to this process, in MB, i.e. not shared with its parent
+  after a fork. Read from /proc/self/smaps_rollup, so Linux-only.
+  """
+  private_kb = 0
+  with open("/proc/self/smaps_rollup") as f:
+    for line in f:
+      if line.startswith(("Private_Clean:", "Private_Dirty:")):
+        private_kb += int(line.split()[1])
+  return private_kb / 2 ** 10
+
+
+class _PathProbe(torch.utils.data.Dataset):
+  """Reads entry idx of each of columns, which must support integer indexing,
+  and returns the id and private memory of the DataLoader worker that read it.
+  Images are not loaded, so that only the path storage is measured.
+  """
+
+  def __init__(self, columns):
+    self.columns = columns
+
+  def __len__(self):
+    return len(self.columns[0])
+
+  def __getitem__(self, idx):
+    for column in self.columns:
+      column[idx]
+    return torch.utils.data.get_worker_info().id, private_memory_mb()
+
+
+def _worker_memory_growth(columns, num_workers, batch_size):
+  loader = torch.utils.data.DataLoader(_PathProbe(columns), batch_size=batch_size,
+                                       num_workers=num_workers,
+                                       multiprocessing_context="fork")
+  report = {}
+  for worker_ids, memory_mbs in loader:
+    for worker_id, memory_mb in zip(worker_ids.tolist(), memory_mbs.tolist()):
+      row = report.setdefault(worker_id, {"first_mb": memory_mb})
+      row["last_mb"] = memory_mb
+
+  for row in report.values():
+    row["growth_mb"] = row["last_mb"] - row["first_mb"]
+
+  return report
+
+
+def measure_worker_memory(dataset, num_workers=2, batch_size=256):
+  """Reads every path of the data.VidSegDataset dataset for one epoch
+  with num_workers forked DataLoader workers and reports how much
+  the private memory of each worker grew, i.e. how much shared memory
+  it copied on write. Linux-only.
+
+  The same is done for a control that reads the same paths
+  from a pd.DataFrame of Python strings, as VidSegDataset used to.
+
+  Returns:
+    report: dict[string: dict[int: dict]]
+      For "packed" and "pandas" storage, and each worker id, the worker's
+      private memory in MB after its first and last samples, and the growth between them.
+  """
+  if num_workers < 1:
+    raise ValueError(f"measuring worker memory needs num_workers >= 1, not {num_workers}")
+
+  packed = [dataset._image_paths]
+  if dataset.has_annotations:
+    packed.append(dataset._annotation_paths)
+  # built before the workers fork, like a pandas-backed dataset's paths would be
+  control = [series.iloc for _, series in dataset.paths_df.items()]
+
+  return {"packed": _worker_memory_growth(packed, num_workers, batch_size),
+          "pandas": _worker_memory_growth(control, num_workers, batch_size)}
+
+
+def check_worker_memory(dataset, num_workers=2, batch_size=256, max_growth_mb=2.0):
+  """Raises an AssertionError if reading the paths of the data.VidSegDataset dataset
+  grows the private memory of any forked DataLoader worker by more than max_growth_mb.
+  See measure_worker_memory, whose report is returned.
+
+  Skipped, returning None with a warning, on platforms other than Linux.
+  """
+  if not sys.platform.startswith("linux"):
+    warnings.warn("check_worker_memory needs /proc/self/smaps_rollup, skipping")
+    return None
+
+  report = measure_worker_memory(dataset, num_workers, batch_size)
+  growth_mb = max(row["growth_mb"] for row in report["packed"].values())
+  control_mb = max(row["growth_mb"] for row in report["pandas"].values())
+  assert growth_mb <= max_growth_mb, \
+    (f"DataLoader worker private memory grew by {growth_mb:.1f}MB over an epoch, "
+     f"limit is {max_growth_mb}MB (pandas-backed control grew by {control_mb:.1f}MB)")
+
+  return report
@@ -0,0 +1,249 @@
+"""Tools for post-training int8 quantization of a torch.Module
+and for comparing the quantized model against the original.
+
+Static quantization uses FX graph mode, so models must be
+symbolically traceable with torch.fx. Dynamic quantization only
+converts nn.Linear and recurrent layers, and so leaves purely
+convolutional models largely unchanged.
+
+Quantized models are saved to Artifacts as TorchScript,
+so they can be loaded without the model's class or calibration data,
+with load_quantized_model_from_artifact.
+"""
+import copy
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+from . import evaluate, utils
+from ..utils import cache, clips, paths
+
+
+def dynamic(model, dtype=torch.qint8):
+  """Returns a copy of model with dynamically quantized
+  nn.Linear, nn.LSTM, and nn.GRU layers.
+  """
+  model = copy.deepcopy(model).cpu().eval()
+  return torch.quantization.quantize_dynamic(
+    model, {torch.nn.Linear, torch.nn.LSTM, torch.nn.GRU}, dtype=dtype)
+
+
+def static(model, calibration_dataset, num_samples=32, batch_size=8, backend="fbgemm", seed=0):
+  """Returns a copy of model with weights and activations quantized to int8,
+  with activation ranges calibrated on num_samples images chosen at random,
+  with seed, from calibration_dataset, e.g. a data.VidSegDataset.
+  """
+  try:
+    from torch.ao.quantization import get_default_qconfig_mapping, quantize_fx
+    qconfig = get_default_qconfig_mapping(backend)
+  except ImportError:
+    from torch.quantization import quantize_fx
+    qconfig = {"": torch.quantization.get_default_qconfig(backend)}
+
+  model = copy.deepcopy(model).cpu().eval()
+  images = sample_images(calibration_dataset, num_samples, seed)
+
+  previous_engine = torch.backends.quantized.engine
+  torch.backends.quantized.engine = backend
+  try:
+    try:
+      prepared = quantize_fx.prepare_fx(model, qconfig, example_inputs=(images[:1],))
+    except TypeError:
+      prepared = quantize_fx.prepare_fx(model, qconfig)
+
+    with torch.no_grad():
+      for start in range(0, len(images), batch_size):
+        prepared(images[start:start + batch_size])
+
+    return quantize_fx.convert_fx(prepared)
+  finally:
+    torch.backends.quantized.engine = previous_engine
+
+
+def sample_images(dataset, num_samples, seed=0):
+  """Stacks the images from num_samples entries of dataset, chosen at random with seed."""
+  rng = random.Random(seed)
+  indices = rng.sample(range(len(dataset)), min(num_samples, len(dataset)))
+  images = []
+  for idx in indices:
+    sample = dataset[idx]
+    if isinstance(sample, (list, tuple)):
+      sample = sample[0]
+    images.append(sample)
+  return torch.stack(images)
+
+
+def split_calibration(dataset, annotation_paths, fraction=0.2, seed=0):
+  """Holds out about fraction of dataset, chosen at random with seed, for calibration.
+  If dataset has a paths_df, whole clips are held out, see ..utils.clips,
+  so that no calibration frame has a near-duplicate neighbour in the evaluation set.
+
+  Returns:
+    calibration_dataset: torch.utils.data.Subset
+    evaluation_dataset: torch.utils.data.Subset
+    evaluation_annotation_paths: pd.Series
+      Entries of annotation_paths for evaluation_dataset, with index reset.
+  """
+  rng = random.Random(seed)
+  if hasattr(dataset, "paths_df"):
+    clip_ids = list(clips.get_clips(dataset.paths_df.reset_index(drop=True), columns=["raw"]))
+    clip_names = sorted(set(clip_ids))
+    rng.shuffle(clip_names)
+    calibration_clips = set(clip_names[:max(1, int(fraction * len(clip_names)))])
+    calibration_indices = [ii for ii, clip_id in enumerate(clip_ids)
+                           if clip_id in calibration_clips]
+  else:
+    calibration_indices = rng.sample(range(len(dataset)), max(1, int(fraction * len(dataset))))
+
+  held_out = set(calibration_indices)
+  evaluation_indices = [ii for ii in range(len(dataset)) if ii not in held_out]
+  if not evaluation_indices:
+    raise ValueError("holding out calibration data left nothing to evaluate on")
+
+  return (torch.utils.data.Subset(dataset, sorted(calibration_indices)),
+          torch.utils.data.Subset(dataset, evaluation_indices),
+          annotation_paths.iloc[evaluation_indices].reset_index(drop=True))
+
+
+def script(model, dataset, seed=0):
+  """Traces model with TorchScript on an image from dataset."""
+  with torch.no_grad():
+    return torch.jit.trace(model, sample_images(dataset, 1, seed))
+
+
+def model_size_mb(path):
+  """Size of the saved model at path, in MB."""
+  return os.path.getsize(path) / 2 ** 20
+
+
+def latency(model, dataset, num_frames=16, warmup=2, seed=0):
+  """Median seconds per frame for model on single CPU frames from dataset."""
+  images = sample_images(dataset, num_frames + warmup, seed)
+  timings = []
+  with torch.no_grad():
+    for ii in range(len(images)):
+      start = time.perf_counter()
+      model(images[ii:ii + 1])
+      timings.append(time.perf_counter() - start)
+  timings = sorted(timings[warmup:])
+  return timings[len(timings) // 2]
+
+
+def report(models, dataset, annotation_paths, output_dir, batch_size=8, num_frames=16, seed=0):
+  """Compares models on size, per-frame latency, and IoU.
+
+  Parameters:
+    models: dict[string: torch.nn.Module]
+      Models to compare, e.g. {"fp32": model, "int8": static(model, calibration_dataset)}.
+    dataset: torch.utils.data.Dataset
+      Images to evaluate on, e.g. a data.VidSegDataset with has_annotations=False.
+      Should not include any calibration data, see split_calibration.
+    annotation_paths: pd.Series
+      Paths to ground truth annotations for dataset, see ..evaluate.run_evaluation.
+    output_dir: str or Path
+      Outputs for each model are saved in output_dir/{name}/outputs,
+      and the model itself, as TorchScript, at output_dir/{name}/model.pt.
+
+  Returns:
+    report: dict[string: dict]
+      For each model, the size in MB of its TorchScript file,
+      median seconds per frame, and mean IoU.
+  """
+  from .. import evaluate as contest_evaluate
+
+  results = {}
+  for name, model in models.items():
+    model_dir = Path(output_dir) / name / "outputs"
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    dataloader = torch.utils.data.DataLoader(dataset, batch_size=batch_size)
+    output_paths = evaluate.run(model, dataloader, len(dataset), model_dir)
+    output_paths = paths.rebase_paths(output_paths["output"], str(model_dir.parent))
+    _, metrics = contest_evaluate.run_evaluation(output_paths, annotation_paths)
+
+    model_path = str(model_dir.parent / "model.pt")
+    torch.jit.save(script(model, dataset, seed), model_path)
+
+    results[name] = {"size_mb": model_size_mb(model_path),
+                     "seconds_per_frame": latency(model, dataset, num_frames, seed=seed),
+                     "mean_iou": metrics["mean_iou"]}
+
+  return results
+
+
+def quantize_artifact(name, model_class, dataset, annotation_paths, quantized_name,
+                      method="static", calibration_dataset=None, output_dir=None,
+                      model_args=None, model_kwargs=None, seed=0):
+  """During a wandb.Run, loads the model at artifact name with
+  utils.load_model_from_artifact, quantizes it with method,
+  "static" or "dynamic", calibrating on calibration_dataset,
+  and compares it with the original model on dataset, see report.
+
+  If calibration_dataset is not provided, part of dataset is held out
+  for calibration with split_calibration, and the rest is used for evaluation,
+  so that int8 accuracy is never measured on the data it was calibrated on.
+
+  The quantized model is traced with TorchScript and saved as a wandb.Artifact
+  named quantized_name with utils.save_model_to_artifact.
+  Load it again with load_quantized_model_from_artifact.
+
+  Outputs of the comparison are saved in output_dir,
+  or in a temporary directory that is removed afterwards.
+
+  Returns:
+    identifier: string
+      Complete identifier of the quantized model's Artifact.
+    report: dict[string: dict]
+      Comparison of the "fp32" and "int8" models, see report.
+      The "int8" size is that of the file saved to the Artifact.
+  """
+  if method not in ["static", "dynamic"]:
+    raise ValueError(f"method must be 'static' or 'dynamic', not {method}")
+
+  if calibration_dataset is None:
+    calibration_dataset, dataset, annotation_paths = split_calibration(
+      dataset, annotation_paths, seed=seed)
+
+  model = utils.load_model_from_artifact(name, model_class,
+                                         model_args=model_args, model_kwargs=model_kwargs)
+  model = model.cpu()
+  if method == "static":
+    quantized_model = static(model, calibration_dataset, seed=seed)
+  else:
+    quantized_model = dynamic(model)
+
+  if output_dir is None:
+    with tempfile.TemporaryDirectory() as temporary_dir:
+      return _compare_and_save(model, quantized_model, dataset, annotation_paths,
+                               quantized_name, temporary_dir, seed)
+  return _compare_and_save(model, quantized_model, dataset, annotation_paths,
+                           quantized_name, output_dir, seed)
+
+
+def _compare_and_save(model, quantized_model, dataset, annotation_paths, quantized_name,
+                      output_dir, seed):
+  comparison = report({"fp32": model, "int8": quantized_model},
+                      dataset, annotation_paths, output_dir, seed=seed)
+
+  quantized_model_path = str(Path(output_dir) / "quantized_model.pt")
+  identifier = utils.save_model_to_artifact(
+    script(quantized_model, dataset, seed), quantized_model_path, quantized_name,
+    torchscript=True)
+  comparison["int8"]["size_mb"] = model_size_mb(quantized_model_path)
+
+  return identifier, comparison
+
+
+def load_quantized_model_from_artifact(name, model_path="final_model"):
+  """Pulls down the wandb.Artifact at name, through the process-wide ..utils.cache,
+  and loads the TorchScript model saved there by quantize_artifact.
+  Each call returns a new model, placed in evaluation mode.
+  """
+  _, model_artifact_dir = cache.get_cache().download(name)
+  model = torch.jit.load(str(Path(model_artifact_dir) / model_path), map_location="cpu")
+  model.eval()
+  return model
@@ -0,0 +1,222 @@
+"""Utilities for running a torch.Module within a memory budget,
+by choosing the batch size or, when even a single frame is too large,
+by running it on overlapping tiles and blending their outputs.
+
+Tiled outputs match full-frame outputs, up to floating point rounding,
+for fully convolutional models whose outputs have the same size as their inputs,
+provided that
+  - context is at least the radius of the model's receptive field:
+    tile outputs within context pixels of an interior tile edge get zero weight,
+  - alignment is a multiple of the model's output stride,
+    e.g. 2 ** n for a U-Net with n pooling layers: tile sizes, strides, and
+    positions are all multiples of alignment, so every tile sees the same
+    pooling grid as the full frame.
+Seams between tiles are feathered over blend pixels with weights that sum to one.
+See check_tiled_forward.
+"""
+import math
+
+import torch
+
+
+default_context = 96
+default_blend = 16
+default_alignment = 1
+
+
+def model_bytes(model):
+  """Bytes taken up by the parameters and buffers of model."""
+  return sum(tensor.element_size() * tensor.nelement()
+             for tensor in list(model.parameters()) + list(model.buffers()))
+
+
+def estimate_bytes_per_pixel(model, channels=3, probe_size=64):
+  """Estimates the activation memory used by a forward pass of model, per input pixel,
+  by summing the sizes of the input and of the outputs of every submodule
+  on a probe_size x probe_size input.
+
+  Results of functional operations called inside forward, like F.relu or torch.cat,
+  are not counted, nor are copies held elsewhere, e.g. by a DataLoader,
+  so leave headroom when choosing a memory budget.
+  """
+  tensors = list(model.parameters()) + list(model.buffers())
+  device = tensors[0].device if tensors else torch.device("cpu")
+  probe = torch.zeros(1, channels, probe_size, probe_size, device=device)
+  total_bytes = [probe.element_size() * probe.nelement()]
+
+  def count_output(module, inputs, output):
+    if torch.is_tensor(output):
+      total_bytes[0] += output.element_size() * output.nelement()
+
+  # in training mode, the probe would update e.g. BatchNorm running statistics
+  training = model.training
+  model.eval()
+  hooks = [module.register_forward_hook(count_output)
+           for module in model.modules() if not list(module.children())]
+  try:
+    with torch.no_grad():
+      model.forward(probe)
+  finally:
+    for hook in hooks:
+      hook.remove()
+    model.train(training)
+
+  return total_bytes[0] / probe_size ** 2
+
+
+def plan(model, frame_shape, memory_budget, context=default_context, blend=default_blend,
+         alignment=default_alignment):
+  """Chooses how to run model on frames of shape CHW within memory_budget bytes,
+  which covers the model's parameters and buffers plus its estimated activations.
+  See estimate_bytes_per_pixel.
+
+  Returns:
+    batch_size: int
+      Number of frames to run at once.
+    tile_size: None or tuple of int
+      None if whole frames fit in the budget, otherwise the (height, width)
+      of the tiles to pass to tiled_forward, with batch_size 1.
+  """
+  channels, height, width = frame_shape
+  activation_budget = memory_budget - model_bytes(model)
+  if activation_budget <= 0:
+    raise ValueError(f"memory_budget of {memory_budget} bytes does not fit "
+                     f"the model's {model_bytes(model)} bytes of parameters and buffers")
+  bytes_per_pixel = estimate_bytes_per_pixel(model, channels)
+
+  batch_size = int(activation_budget // (bytes_per_pixel * height * width))
+  if batch_size >= 1:
+    return batch_size, None
+
+  # the last tile on each axis can be up to alignment - 1 pixels longer, see tile_spans
+  tile_pixels = int(activation_budget // bytes_per_pixel)
+  side = int(math.sqrt(tile_pixels))
+  tile_height = align(min(height, side), alignment, slack=side < height)
+  tile_width = align(min(width, tile_pixels // max(side, 1)), alignment,
+                     slack=tile_pixels // max(side, 1) < width)
+  for tile, size in [(tile_height, height), (tile_width, width)]:
+    if tile < size and tile_stride(tile, context, blend, alignment) < alignment:
+      raise ValueError(f"memory_budget of {memory_budget} bytes only allows tiles of "
+                       f"{tile_height}x{tile_width}, too small for context {context}, "
+                       f"blend {blend}, and alignment {alignment}")
+
+  return 1, (tile_height, tile_width)
+
+
+def align(length, alignment, slack=False):
+  """Rounds length down to a multiple of alignment,
+  leaving room for one more alignment if slack.
+  """
+  aligned = (length // alignment) * alignment
+  if slack:
+    aligned -= alignment
+  return max(aligned, 0)
+
+
+def tile_stride(tile, context=default_context, blend=default_blend, alignment=default_alignment):
+  """Distance between the starts of consecutive tiles of length tile,
+  so that they overlap by at least 2 * context + blend.
+  """
+  return align(tile - 2 * context - blend, alignment)
+
+
+def tile_spans(size, tile, context=default_context, blend=default_blend,
+               alignment=default_alignment):
+  """(start, stop) positions of tiles of length tile covering an axis of length size,
+  overlapping by at least 2 * context + blend, with starts at multiples of alignment.
+  The last tile runs to the end of the axis, so it may be up to alignment - 1 longer.
+  """
+  if tile % alignment:
+    raise ValueError(f"tile length {tile} is not a multiple of alignment {alignment}")
+  last_start = align(max(size - tile, 0), alignment)
+  if last_start == 0:
+    return [(0, size)]
+
+  stride = tile_stride(tile, context, blend, alignment)
+  if stride < alignment:
+    raise ValueError(f"tiles of length {tile} are too small for context {context}, "
+                     f"blend {blend}, and alignment {alignment}")
+  starts = list(range(0, last_start, stride)) + [last_start]
+  return [(start, start + tile) for start in starts[:-1]] + [(last_start, size)]
+
+
+def tile_weights(start, stop, size, context=default_context, blend=default_blend):
+  """Blending weights along one axis for the tile from start to stop:
+  zero within context of interior edges, then ramping up over blend pixels.
+  """
+  tile = stop - start
+  weights = torch.ones(tile)
+  ramp = (torch.arange(blend, dtype=weights.dtype) + 0.5) / blend
+  if start > 0:
+    weights[:context] = 0
+    weights[context:context + blend] = ramp
+  if stop < size:
+    weights[tile - context:] = 0
+    weights[tile - context - blend:tile - context] = ramp.flip(0)
+  return weights
+
+
+def tiled_forward(model, frames, tile_size, context=default_context, blend=default_blend,
+                  alignment=default_alignment):
+  """Runs model on overlapping tiles of the BCHW Tensor frames
+  and blends the tile outputs into full-frame outputs.
+  """
+  height, width = frames.shape[-2:]
+  tile_height = min(tile_size[0], align(height, alignment) or height)
+  tile_width = min(tile_size[1], align(width, alignment) or width)
+
+  outputs, total_weights = None, None
+  for top, bottom in tile_spans(height, tile_height, context, blend, alignment):
+    for left, right in tile_spans(width, tile_width, context, blend, alignment):
+      tile_outputs = model.forward(frames[..., top:bottom, left:right])
+      if tuple(tile_outputs.shape[-2:]) != (bottom - top, right - left):
+        raise ValueError(f"model output of shape {tuple(tile_outputs.shape)} does not match "
+                         f"{bottom - top}x{right - left} tile; tiling needs outputs "
+                         "the same size as inputs, and alignment a multiple of the output stride")
+
+      if outputs is None:
+        outputs = tile_outputs.new_zeros(tile_outputs.shape[:-2] + (height, width))
+        total_weights = tile_outputs.new_zeros(height, width)
+
+      weights = (tile_weights(top, bottom, height, context, blend)[:, None]
+                 * tile_weights(left, right, width, context, blend)[None, :])
+      weights = weights.to(device=outputs.device, dtype=outputs.dtype)
+
+      outputs[..., top:bottom, left:right] += tile_outputs * weights
+      total_weights[top:bottom, left:right] += weights
+
+  return outputs / total_weights
+
+
+def pooling_model(channels=3, width=8):
+  """A small fully convolutional model with two 2x2 poolings, so output stride 4,
+  and a receptive field radius under 32 pixels, for use with check_tiled_forward.
+  """
+  return torch.nn.Sequential(
+    torch.nn.Conv2d(channels, width, 3, padding=1), torch.nn.ReLU(),
+    torch.nn.MaxPool2d(2),
+    torch.nn.Conv2d(width, width, 3, padding=1), torch.nn.ReLU(),
+    torch.nn.MaxPool2d(2),
+    torch.nn.Conv2d(width, width, 3, padding=1), torch.nn.ReLU(),
+    torch.nn.Upsample(scale_factor=4, mode="nearest"),
+    torch.nn.Conv2d(width, 1, 3, padding=1), torch.nn.Sigmoid()).eval()
+
+
+def check_tiled_forward(model=None, frame_shape=(3, 200, 264), tile_size=(104, 120),
+                        context=32, blend=16, alignment=4, atol=1e-5):
+  """Raises an AssertionError if tiled_forward of model on a random frame
+  differs from model.forward by more than atol. Returns the largest difference.
+  Defaults to a pooling_model, with matching context and alignment.
+  """
+  if model is None:
+    model = pooling_model(frame_shape[0])
+
+  frames = torch.rand(1, *frame_shape)
+  with torch.no_grad():
+    expected = model.forward(frames)
+    tiled = tiled_forward(model, frames, tile_size, context, blend, alignment)
+
+  difference = (expected - tiled).abs().max().item()
+  assert difference <= atol, \
+    f"tiled output differs from full-frame output by up to {difference}"
+  return difference
@@ -4,16 +4,24 @@ import numpy as np
 import torch
 import wandb
 
+from ..utils import cache
 
-def save_model_to_artifact(model, path, name, artifact_path="final_model"):
+
+def save_model_to_artifact(model, path, name, artifact_path="final_model", torchscript=False):
   """During a wandb.Run, save a model to path and as a wandb.Artifact
   and returns the resulting Artifact's complete identifier.
 
+  The model's state_dict is saved, unless torchscript is True,
+  in which case model must be a torch.jit.ScriptModule and is saved whole.
+
   See PyTorch documentation for details on saving and loading models:
     https://pytorch.org/tutorials/beginner/saving_loading_models.html
   """
   model_artifact = wandb.Artifact(name=name, type="trained-model")
-  torch.save(model.state_dict(), path)
+  if torchscript:
+    torch.jit.save(model, path)
+  else:
+    torch.save(model.state_dict(), path)
   model_artifact.add_file(path, artifact_path)
   wandb.run.log_artifact(model_artifact)
   
@@ -25,12 +33,18 @@ def save_model_to_artifact(model, path, name, artifact_path="final_model"):
   return "/".join([wandb.run.entity, wandb.run.project, model_artifact.name])
 
 
-def load_model_from_artifact(name, model_class, model_path="final_model", model_args=None, model_kwargs=None):
+def load_model_from_artifact(name, model_class, model_path="final_model", model_args=None, model_kwargs=None,
+                             use_cache=True):
   """Pulls down the wandb.Artifact at name and loads the model state_dict at model_path,
   then feeds it to the provided model_class after passing in any model_args and model_kwargs.
 
   Model is placed in evaluation mode.
 
+  If use_cache, the Artifact's files come from the process-wide ..utils.cache,
+  which only downloads each Artifact digest once, and the state_dict is kept
+  in memory, memory-mapped where the installed torch supports it, for later calls.
+  Every call still returns a new model with its own copy of the weights.
+
   See PyTorch documentation for details on saving and loading models:
     https://pytorch.org/tutorials/beginner/saving_loading_models.html
   """
@@ -39,17 +53,30 @@ def load_model_from_artifact(name, model_class, model_path="final_model", model_
   if model_kwargs is None:
     model_kwargs = {}
 
-  model_artifact = wandb.run.use_artifact(name)
-  model_artifact_dir = model_artifact.download()
-  model_state_dict_path = os.path.join(model_artifact_dir, "final_model")
+  def loader(model_artifact_dir):
+    return load_state_dict(os.path.join(model_artifact_dir, model_path))
+
+  if use_cache:
+    state_dict = cache.get_cache().load(name, loader, key=model_path)
+  else:
+    model_artifact = wandb.run.use_artifact(name)
+    state_dict = loader(model_artifact.download())
 
   model = model_class(*model_args, **model_kwargs)
-  model.load_state_dict(torch.load(model_state_dict_path))
+  model.load_state_dict(state_dict)
   model.eval()
 
   return model
 
 
+def load_state_dict(path):
+  """Loads the state_dict at path onto the CPU, memory-mapped if possible."""
+  try:
+    return torch.load(path, map_location="cpu", mmap=True)
+  except (TypeError, RuntimeError):
+    return torch.load(path, map_location="cpu")
+
+
 def to_numpy_int_arrays(outputs, scale=255):
   """Convert PyTorch Module outputs from 0 to 1 float Tensors
   into np.uint8 arrays with values from 0 to scale (default 255).
@@ -1 +1,16 @@
-from . import clips, paths
+import importlib
+
+_lazy_submodules = ["benchmark", "cache", "clips", "image", "keyframes", "paths"]
+
+
+def __getattr__(name):
+  if name not in _lazy_submodules:
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+  module = importlib.import_module("." + name, __name__)
+  globals()[name] = module
+  return module
+
+
+def __dir__():
+  return sorted(set(globals()) | set(_lazy_submodules))
@@ -0,0 +1,78 @@
+"""Benchmarks for regressions in the cost of importing the contest package.
+
+Each measurement runs in a fresh interpreter, so that modules already
+imported by the calling process do not hide the true cost of an import.
+"""
+import json
+import subprocess
+import sys
+
+
+heavy_modules = ["tensorflow", "torch", "torchvision", "pytorch_lightning",
+                 "wandb", "pandas", "skimage"]
+
+_import_script = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+scale = 1 if sys.platform == "darwin" else 1024
+loaded = [name for name in {heavy_modules!r} if name in sys.modules]
+print(json.dumps({{"seconds": seconds, "max_rss_mb": maxrss * scale / 2 ** 20,
+                  "heavy_modules": loaded}}))
+"""
+
+
+def measure_import(module="contest", repeats=5):
+  """Measures the wall-clock time and peak resident memory
+  of importing module in a fresh Python interpreter.
+
+  Parameters:
+    module: string
+      Dotted name of the module to import.
+    repeats: int
+      Number of fresh interpreters to time the import in.
+
+  Returns:
+    report: dict
+      Minimum import time in seconds, the peak RSS in MB
+      of the interpreter after the import, and the list of
+      modules from heavy_modules that the import pulled in.
+  """
+  script = _import_script.format(module=module, heavy_modules=heavy_modules)
+
+  runs = []
+  for _ in range(repeats):
+    result = subprocess.run([sys.executable, "-c", script],
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True)
+    runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+  return {"module": module,
+          "seconds": min(run["seconds"] for run in runs),
+          "max_rss_mb": max(run["max_rss_mb"] for run in runs),
+          "heavy_modules": runs[0]["heavy_modules"]}
+
+
+def check_import(module="contest", max_seconds=None, max_rss_mb=None, allowed_modules=()):
+  """Raises an AssertionError if importing module is slower than max_seconds,
+  uses more than max_rss_mb of memory, or loads any of heavy_modules
+  that are not in allowed_modules. Returns the report from measure_import.
+  """
+  report = measure_import(module)
+
+  unexpected = [name for name in report["heavy_modules"] if name not in allowed_modules]
+  assert not unexpected, f"importing {module} loaded heavy modules: {unexpected}"
+  if max_seconds is not None:
+    assert report["seconds"] <= max_seconds, \
+      f"importing {module} took {report['seconds']:.3f}s, limit is {max_seconds}s"
+  if max_rss_mb is not None:
+    assert report["max_rss_mb"] <= max_rss_mb, \
+      f"importing {module} used {report['max_rss_mb']:.1f}MB, limit is {max_rss_mb}MB"
+
+  return report
+
+
+if __name__ == "__main__":
+  for name in sys.argv[1:] or ["contest"]:
+    print(measure_import(name))
@@ -0,0 +1,147 @@
+"""A process-wide cache for model Artifacts: on disk, keyed by Artifact digest,
+and in memory, for a limited number of recently loaded state_dicts or models.
+
+Artifacts are located by a resolver, a callable that takes an Artifact name
+and returns its digest and a function that downloads its files into a directory.
+The default, wandb_resolver, uses the current wandb.Run.
+LocalResolver serves Artifacts from a local directory instead,
+e.g. for testing without access to the Weights & Biases service.
+"""
+import collections
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+
+default_cache_dir = os.path.join("~", ".cache", "contest", "artifacts")
+
+
+def wandb_resolver(name):
+  import wandb
+
+  artifact = wandb.run.use_artifact(name)
+  return artifact.digest, lambda root: artifact.download(root=root)
+
+
+class LocalResolver:
+  """Resolves Artifact names to directories inside root,
+  at root/name, with digests computed from the directories' file listings.
+  See directory_digest.
+  """
+
+  def __init__(self, root):
+    self.root = Path(root)
+
+  def __call__(self, name):
+    directory = self.root / name
+    if not directory.is_dir():
+      raise KeyError(f"no local Artifact {name} in {self.root}")
+    return directory_digest(directory), lambda root: shutil.copytree(directory, root)
+
+
+def directory_digest(directory):
+  """Hashes the relative paths, sizes, and modification times of the files
+  in directory, without reading their contents, so that resolving
+  large checkpoints stays cheap.
+  """
+  digest = hashlib.sha256()
+  for path in sorted(Path(directory).rglob("*")):
+    if path.is_file():
+      stat = path.stat()
+      digest.update(f"{path.relative_to(directory)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+  return digest.hexdigest()
+
+
+class ArtifactCache:
+  """Caches Artifact files on disk under cache_dir, one directory per digest,
+  and what is loaded from them in memory, up to max_models entries,
+  evicting the least recently used.
+
+  Loaded values are shared between callers that load the same Artifact
+  with the same key, so they should not be modified in place.
+  Prefer caching immutable data, like state_dicts, over whole models.
+  """
+
+  def __init__(self, cache_dir=None, max_models=4, resolver=None):
+    if cache_dir is None:
+      cache_dir = os.environ.get("CONTEST_CACHE_DIR", default_cache_dir)
+    self.cache_dir = Path(cache_dir).expanduser()
+    self.max_models = max_models
+    self.resolver = wandb_resolver if resolver is None else resolver
+
+    self._models = collections.OrderedDict()
+    self._lock = threading.RLock()
+
+  def download(self, name):
+    """Returns the digest of the Artifact at name and a local directory
+    containing its files, downloading them only if they are not on disk.
+    """
+    digest, download = self.resolver(name)
+    directory = self.cache_dir / digest
+
+    if not directory.is_dir():
+      self.cache_dir.mkdir(parents=True, exist_ok=True)
+      staging_dir = Path(tempfile.mkdtemp(dir=self.cache_dir))
+      try:
+        download(str(staging_dir / "files"))
+        try:
+          os.rename(staging_dir / "files", directory)
+        except OSError:
+          # another process finished downloading the same digest first
+          if not directory.is_dir():
+            raise
+      finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    return digest, str(directory)
+
+  def load(self, name, loader, key=None):
+    """Returns loader(directory) for the Artifact at name,
+    reusing the result of an earlier call with the same digest and key.
+    The result is shared with those calls, not copied.
+    """
+    digest, directory = self.download(name)
+    cache_key = (digest, key)
+
+    with self._lock:
+      if cache_key in self._models:
+        self._models.move_to_end(cache_key)
+        return self._models[cache_key]
+
+    value = loader(directory)
+
+    with self._lock:
+      self._models[cache_key] = value
+      self._models.move_to_end(cache_key)
+      while len(self._models) > self.max_models:
+        self._models.popitem(last=False)
+
+    return value
+
+  def clear(self, disk=False):
+    """Drops everything loaded from memory and, if disk, all Artifact files."""
+    with self._lock:
+      self._models.clear()
+    if disk:
+      shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+_cache = None
+
+
+def get_cache():
+  """Returns the process-wide ArtifactCache, creating it if needed."""
+  global _cache
+  if _cache is None:
+    _cache = ArtifactCache()
+  return _cache
+
+
+def configure(cache_dir=None, max_models=4, resolver=None):
+  """Replaces the process-wide ArtifactCache and returns it."""
+  global _cache
+  _cache = ArtifactCache(cache_dir, max_models, resolver)
+  return _cache
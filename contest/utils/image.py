@@ -1,17 +1,17 @@
 from pathlib import Path
 
 import numpy as np
-import PIL
+from PIL import Image
 
 
 def save_from_array(arr, folder, index):
-  im = PIL.Image.fromarray(arr)
+  im = Image.fromarray(arr)
   path = Path(folder) / (str(index).zfill(5) + ".png")
   im.save(path)
   return str(path)
 
   
 def load_to_array(path):
-    im = PIL.Image.open(path)
+    im = Image.open(path)
     arr = np.array(im)
     return arr
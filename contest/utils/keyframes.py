@@ -0,0 +1,134 @@
+"""Utilities for running a model only on the keyframes of each clip
+and filling in the masks of the frames in between.
+
+Clips are runs of consecutive frames with the same clip id, see clips.get_clips.
+The first and last frames of every clip are always keyframes,
+so every other frame lies between two keyframes from its own clip.
+"""
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+def clip_bounds(clip_ids):
+  """Returns a list of (start, stop) positions of the runs
+  of consecutive equal entries in clip_ids.
+  """
+  clip_ids = list(clip_ids)
+  bounds = []
+  start = 0
+  for ii in range(1, len(clip_ids) + 1):
+    if ii == len(clip_ids) or clip_ids[ii] != clip_ids[start]:
+      bounds.append((start, ii))
+      start = ii
+  return bounds
+
+
+def keyframe_indices(clip_ids, interval):
+  """Returns the sorted positions of the keyframes: every interval-th frame
+  of each clip, counting from its first frame, plus the last frame of each clip.
+  """
+  if interval < 1:
+    raise ValueError(f"keyframe interval must be at least 1, not {interval}")
+
+  indices = []
+  for start, stop in clip_bounds(clip_ids):
+    indices.extend(range(start, stop, interval))
+    if indices[-1] != stop - 1:
+      indices.append(stop - 1)
+  return indices
+
+
+def interpolate(previous, following, weight):
+  """Linearly blends two np.uint8 masks, with weight
+  the fraction of the way from previous to following.
+  """
+  blended = (1 - weight) * previous.astype(np.float32) + weight * following.astype(np.float32)
+  return np.rint(blended).astype(np.uint8)
+
+
+def propagate(keyframe_outputs, clip_ids, interval):
+  """Fills in masks for the frames between keyframes.
+
+  Parameters:
+    keyframe_outputs: iterable of np.uint8 arrays
+      Model outputs for the frames at keyframe_indices(clip_ids, interval), in order.
+    clip_ids: pd.Series or list
+      Clip id of every frame, see clips.get_clips.
+    interval: int
+      Keyframe interval used to select the frames in keyframe_outputs.
+
+  Yields:
+    mask: np.uint8 array
+      Mask for every frame, in order. Keyframes yield their model output,
+      other frames an interpolation of the surrounding keyframes' outputs.
+  """
+  previous_index, previous_output = None, None
+  for index, output in zip(keyframe_indices(clip_ids, interval), keyframe_outputs):
+    # frames between consecutive keyframes always belong to a single clip
+    if previous_index is not None:
+      for ii in range(previous_index + 1, index):
+        weight = (ii - previous_index) / (index - previous_index)
+        yield interpolate(previous_output, output, weight)
+    yield output
+    previous_index, previous_output = index, output
+
+
+def compare_intervals(run, annotation_paths, output_dir, intervals=(1, 2, 4, 8), warmup=True):
+  """Measures the speedup and IoU cost of keyframe inference at each interval,
+  relative to the smallest interval in intervals.
+
+  If warmup, run is first called once, untimed, at the largest interval,
+  so that one-off costs like starting loader workers, allocating memory,
+  autotuning kernels, or tracing graphs are not charged to the baseline.
+
+  Parameters:
+    run: callable
+      Called as run(interval, output_dir), it should run a model
+      with that keyframe_interval, saving into output_dir, and return
+      the output_paths, as from torch_utils.evaluate.run or keras_utils.evaluate.run.
+    annotation_paths: pd.Series
+      Paths to ground truth annotations, see ..evaluate.run_evaluation.
+    output_dir: str or Path
+      Outputs for each interval are saved in output_dir/interval-{k}/outputs.
+    intervals: iterable of int
+      Keyframe intervals to compare.
+    warmup: bool
+      Whether to make an untimed warm-up call to run before timing,
+      saving into output_dir/warmup/outputs.
+
+  Returns:
+    report: dict[int: dict]
+      For each interval, the run time in seconds, the mean IoU,
+      and the speedup and IoU cost relative to the smallest interval.
+  """
+  from .. import evaluate
+  from . import paths
+
+  intervals = sorted(intervals)
+  if warmup:
+    warmup_dir = Path(output_dir) / "warmup" / "outputs"
+    warmup_dir.mkdir(parents=True, exist_ok=True)
+    run(intervals[-1], warmup_dir)
+
+  report = {}
+  for interval in intervals:
+    interval_dir = Path(output_dir) / f"interval-{interval}" / "outputs"
+    interval_dir.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    output_paths = run(interval, interval_dir)
+    seconds = time.perf_counter() - start
+
+    output_paths = paths.rebase_paths(output_paths["output"], str(interval_dir.parent))
+    _, metrics = evaluate.run_evaluation(output_paths, annotation_paths)
+
+    report[interval] = {"seconds": seconds, "mean_iou": metrics["mean_iou"]}
+
+  baseline = report[min(report)]
+  for row in report.values():
+    row["speedup"] = baseline["seconds"] / row["seconds"]
+    row["iou_cost"] = baseline["mean_iou"] - row["mean_iou"]
+
+  return report
@@ -1,6 +1,7 @@
 import os
 import pathlib
 
+import numpy as np
 import pandas as pd
 
 
@@ -92,3 +93,33 @@ def convert_path_to_os(path_string):
 def assert_compatibility(path_string):
     error_msg = f"found mixed forward and backward slashes in path: {path_string}"
     assert not ("\\" in path_string and "/" in path_string), error_msg
+
+
+class PackedStrings:
+  """Stores a sequence of strings as one contiguous np.uint8 buffer of
+  UTF-8 bytes plus an array of offsets, decoding each string only when indexed.
+
+  Unlike a pd.Series or list of Python str objects, reading entries does not
+  touch per-string reference counts, so forked processes such as DataLoader
+  workers can share the storage without copying its memory pages.
+  """
+
+  def __init__(self, strings):
+    encoded = [str(string).encode("utf-8") for string in strings]
+    self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=self.offsets[1:])
+    self.buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, idx):
+    if idx < 0:
+      idx += len(self)
+    if not 0 <= idx < len(self):
+      raise IndexError(f"index {idx} out of range for {len(self)} strings")
+    return self.buffer[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode("utf-8")
+
+  def to_series(self, index=None, name=None):
+    """Decodes all strings into a pd.Series."""
+    return pd.Series([self[ii] for ii in range(len(self))], index=index, name=name)
@@ -5,7 +5,7 @@ setup(name="contest",
       description="Tools for Weights & Biases DAVIS Video Segmentation Contest",
       url="https://github.com/wandb/davis-contest/",
       packages=find_packages(),
-      python_requires=">=3.6.9",
+      python_requires=">=3.7",
       install_requires=[
             "numpy>=1.19.5",
             "pandas>=1.1.5",